@@ -1,16 +1,17 @@
 import logging
-import asyncio
 import os
-from typing import AsyncGenerator
+import time
+from typing import AsyncGenerator, Literal, Optional
 from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException, status, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse, FileResponse, JSONResponse
-from fastapi.staticfiles import StaticFiles
+from fastapi.responses import StreamingResponse, JSONResponse
 from pydantic import BaseModel, Field
 import ollama
 
-from src.config import api_config, ollama_config
+from src.config import api_config, ollama_config, sla_config
+from src.sla import DeadlineStream, PlanIndex, SLAStats, ThroughputTracker
+from src.static import AssetCache, CompressionMiddleware
 
 # 1. Setup Logging
 logging.basicConfig(level=logging.INFO)
@@ -21,10 +22,14 @@ class ChatRequest(BaseModel):
     message: str = Field(..., description="User's query")
     history: list = Field(default_factory=list, description="Chat history")
     stream: bool = Field(default=False, description="Enable streaming response")
+    deadline_ms: Optional[int] = Field(default=None, gt=0, description="Answer deadline in milliseconds")
+    priority: Literal["normal", "urgent"] = Field(default="normal", description="Default deadline tier when deadline_ms is unset")
 
 class ChatResponse(BaseModel):
     response: str
     context: list = Field(default_factory=list, description="Updated context/history")
+    truncated: bool = Field(default=False, description="Generation was cut off at the deadline")
+    source: Literal["model", "plan"] = Field(default="model", description="Model output or substituted plan answer")
 
 # 3. Lifespan Manager
 @asynccontextmanager
@@ -37,9 +42,16 @@ async def lifespan(app: FastAPI):
     except Exception as e:
         logger.error(f"Failed to connect to Ollama: {e}")
         logger.warning("Please ensure Ollama is running (ollama serve)")
+    # Pre-index plan answers used as deadline fallback
+    plan_index.load()
     yield
     # Shutdown
 
+# Deadline / SLA state shared by the chat endpoints
+throughput = ThroughputTracker(sla_config.initial_tokens_per_second, sla_config.throughput_ewma_alpha)
+sla_stats = SLAStats()
+plan_index = PlanIndex(sla_config.plan_index_path, sla_config.plan_min_similarity)
+
 # 4. Initialize FastAPI
 app = FastAPI(
     title="UrbanTransit-Assistant API",
@@ -56,23 +68,9 @@ app.add_middleware(
     allow_methods=api_config.allow_methods,
     allow_headers=api_config.allow_headers,
 )
+app.add_middleware(CompressionMiddleware, min_size=api_config.compression_min_size)
 
-# 6. Mount Frontend (optional)
-static_dir = os.path.join(os.path.dirname(__file__), "web")
-if os.path.isdir(static_dir):
-    app.mount("/static", StaticFiles(directory=static_dir), name="static")
-
-    @app.get("/")
-    async def read_root():
-        return FileResponse(os.path.join(static_dir, "index.html"))
-
-    @app.get("/{path:path}")
-    async def read_spa(path: str, request: Request):
-        if path.startswith("api/") or path == "api":
-            return JSONResponse(status_code=404, content={"detail": "Not Found"})
-        return FileResponse(os.path.join(static_dir, "index.html"))
-
-# 7. Helper Functions
+# 6. Helper Functions
 def build_prompt(message: str, history: list) -> list:
     """Construct message history for Ollama"""
     messages = [{"role": "system", "content": ollama_config.system_prompt}]
@@ -86,11 +84,41 @@ def build_prompt(message: str, history: list) -> list:
     messages.append({"role": "user", "content": message})
     return messages
 
+async def ollama_stream(messages: list, options: dict) -> AsyncGenerator[dict, None]:
+    """Streaming chat on its own AsyncClient; closing the generator aborts the request"""
+    async with ollama.AsyncClient() as client:
+        stream = await client.chat(
+            model=ollama_config.model_name,
+            messages=messages,
+            stream=True,
+            options=options
+        )
+        async for chunk in stream:
+            yield chunk
+
+def resolve_deadline_ms(request: ChatRequest) -> Optional[int]:
+    """Explicit deadline, else the default for the request's priority"""
+    if request.deadline_ms is not None:
+        return request.deadline_ms
+    return sla_config.priority_deadlines_ms.get(request.priority)
+
+def apply_deadline(options: dict, deadline_ms: Optional[int]) -> dict:
+    """Cap num_predict to what observed tokens/s can produce before the deadline"""
+    if deadline_ms is None:
+        return options
+    budget_s = deadline_ms / 1000 * (1 - sla_config.deadline_safety_margin)
+    return {**options, "num_predict": throughput.num_predict(budget_s, sla_config.min_num_predict)}
+
 # 7. Endpoints
 @app.get("/api/v1/health")
 async def health_check():
     return {"status": "ok", "service": "UrbanTransit-Assistant"}
 
+@app.get("/api/v1/sla")
+async def sla_report():
+    """Deadline hit rates per endpoint"""
+    return sla_stats.snapshot()
+
 @app.post("/api/v1/chat", response_model=ChatResponse)
 async def chat(request: ChatRequest):
     """
@@ -98,22 +126,64 @@ async def chat(request: ChatRequest):
     """
     try:
         messages = build_prompt(request.message, request.history)
+        deadline_ms = resolve_deadline_ms(request)
+        options = {
+            "temperature": ollama_config.temperature,
+            "top_p": ollama_config.top_p,
+            "num_ctx": ollama_config.num_ctx,
+        }
         
-        response = ollama.chat(
-            model=ollama_config.model_name,
-            messages=messages,
-            options={
-                "temperature": ollama_config.temperature,
-                "top_p": ollama_config.top_p,
-                "num_ctx": ollama_config.num_ctx,
-            }
+        if deadline_ms is None:
+            response = ollama.chat(
+                model=ollama_config.model_name,
+                messages=messages,
+                options=options
+            )
+            throughput.observe(response)
+            answer = response['message']['content']
+            return ChatResponse(
+                response=answer,
+                context=messages + [{"role": "assistant", "content": answer}]
+            )
+        
+        # Deadline set: stream internally so generation can be cut off in time
+        stream = DeadlineStream(
+            ollama_stream(messages, apply_deadline(options, deadline_ms)),
+            time.monotonic() + deadline_ms / 1000
+        )
+        parts = []
+        async for chunk in stream:
+            if 'message' in chunk and 'content' in chunk['message']:
+                parts.append(chunk['message']['content'])
+            if chunk.get('done'):
+                throughput.observe(chunk)
+        
+        answer, source = "".join(parts), "model"
+        if not answer and stream.truncated:
+            plan_answer = plan_index.lookup(request.message)
+            if plan_answer is not None:
+                answer, source = plan_answer, "plan"
+        sla_stats.record(
+            "chat",
+            hit=not stream.truncated,
+            truncated=stream.truncated and source == "model" and bool(answer),
+            fallback=source == "plan"
         )
+        if not answer and stream.truncated:
+            raise HTTPException(
+                status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+                detail=f"No answer within {deadline_ms} ms"
+            )
         
         return ChatResponse(
-            response=response['message']['content'],
-            context=messages + [{"role": "assistant", "content": response['message']['content']}]
+            response=answer,
+            context=messages + [{"role": "assistant", "content": answer}],
+            truncated=stream.truncated,
+            source=source
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error in chat endpoint: {e}")
         raise HTTPException(
@@ -128,31 +198,50 @@ async def chat_stream(request: ChatRequest):
     """
     try:
         messages = build_prompt(request.message, request.history)
+        deadline_ms = resolve_deadline_ms(request)
+        options = apply_deadline({
+            "temperature": ollama_config.temperature,
+            "top_p": ollama_config.top_p,
+        }, deadline_ms)
+        deadline = time.monotonic() + deadline_ms / 1000 if deadline_ms is not None else None
         
         async def generate() -> AsyncGenerator[str, None]:
-            stream = ollama.chat(
-                model=ollama_config.model_name,
-                messages=messages,
-                stream=True,
-                options={
-                    "temperature": ollama_config.temperature,
-                    "top_p": ollama_config.top_p,
-                }
-            )
+            stream = DeadlineStream(ollama_stream(messages, options), deadline)
             
-            for chunk in stream:
+            answered = False
+            async for chunk in stream:
                 if 'message' in chunk and 'content' in chunk['message']:
+                    answered = answered or bool(chunk['message']['content'])
                     yield chunk['message']['content']
-                    # Let the event loop flush chunks promptly
-                    await asyncio.sleep(0)
+                if chunk.get('done'):
+                    throughput.observe(chunk)
+            
+            fallback = None
+            if not answered and stream.truncated:
+                fallback = plan_index.lookup(request.message)
+            if fallback is not None:
+                yield sla_config.plan_fallback_notice + fallback
+            elif stream.truncated:
+                yield sla_config.truncation_notice
+            
+            if deadline is not None:
+                sla_stats.record(
+                    "chat_stream",
+                    hit=not stream.truncated,
+                    truncated=stream.truncated and answered,
+                    fallback=fallback is not None
+                )
         
+        headers = {
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+        }
+        if deadline_ms is not None:
+            headers["X-Deadline-Ms"] = str(deadline_ms)
         return StreamingResponse(
             generate(),
             media_type="text/plain; charset=utf-8",
-            headers={
-                "Cache-Control": "no-cache",
-                "X-Accel-Buffering": "no",
-            },
+            headers=headers,
         )
         
     except Exception as e:
@@ -162,6 +251,39 @@ async def chat_stream(request: ChatRequest):
             detail=str(e)
         )
 
+# 8. Mount Frontend (optional)
+# Registered last so the SPA catch-all does not shadow the API routes
+static_dir = os.path.join(os.path.dirname(__file__), "web")
+if os.path.isdir(static_dir):
+    # Load and precompress assets once; rescan on change in debug mode
+    assets = AssetCache(
+        static_dir,
+        min_size=api_config.compression_min_size,
+        reload=api_config.debug,
+        immutable_pattern=api_config.immutable_asset_pattern
+    )
+    assets.scan()
+
+    def serve_asset(path: str, request: Request):
+        response = assets.response(path, request)
+        if response is None:
+            return JSONResponse(status_code=404, content={"detail": "Not Found"})
+        return response
+
+    @app.api_route("/static/{path:path}", methods=["GET", "HEAD"])
+    async def read_static(path: str, request: Request):
+        return serve_asset(path, request)
+
+    @app.api_route("/", methods=["GET", "HEAD"])
+    async def read_root(request: Request):
+        return serve_asset("index.html", request)
+
+    @app.api_route("/{path:path}", methods=["GET", "HEAD"])
+    async def read_spa(path: str, request: Request):
+        if path.startswith("api/") or path == "api":
+            return JSONResponse(status_code=404, content={"detail": "Not Found"})
+        return serve_asset("index.html", request)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host=api_config.host, port=api_config.port)
@@ -6,7 +6,7 @@ UrbanTransit-Assistant 配置文件
 import os
 from pathlib import Path
 from dataclasses import dataclass, field
-from typing import List, Optional
+from typing import Dict, List, Optional
 
 # 项目根目录
 PROJECT_ROOT = Path(__file__).parent.parent
@@ -111,6 +111,40 @@ class APIConfig:
     allow_origins: List[str] = field(default_factory=lambda: ["*"])
     allow_methods: List[str] = field(default_factory=lambda: ["*"])
     allow_headers: List[str] = field(default_factory=lambda: ["*"])
+    
+    # 压缩配置：超过该字节数的 JSON 响应与静态资源进行 gzip/brotli 压缩
+    compression_min_size: int = 1024
+    # 视为内容哈希（不可变缓存）的静态文件名正则；None 时仅当文件名含自身内容摘要前缀才视为不可变
+    immutable_asset_pattern: Optional[str] = None
+
+
+@dataclass
+class SLAConfig:
+    """时限 (SLA) 配置"""
+    # 未指定 deadline_ms 时各优先级的默认时限 (毫秒)，None 表示不限时
+    priority_deadlines_ms: Dict[str, Optional[int]] = field(default_factory=lambda: {
+        "normal": None,
+        "urgent": 5000,
+    })
+    
+    # 生成速度估计 (tokens/s)，在观测到真实速度前使用
+    initial_tokens_per_second: float = 20.0
+    # 速度滑动平均系数
+    throughput_ewma_alpha: float = 0.3
+    # 预留给首 token 延迟与网络开销的时限比例
+    deadline_safety_margin: float = 0.2
+    # num_predict 下限
+    min_num_predict: int = 32
+    
+    # 超时兜底答案使用的预案问答索引
+    plan_index_path: str = str(TRAIN_DATA_PATH)
+    # 兜底答案的最低相似度 (字符二元组 Jaccard)，低于该值不替换
+    plan_min_similarity: float = 0.2
+    
+    # 截断提示
+    truncation_notice: str = "\n\n[回答因时限截断，请以现场指挥为准]"
+    # 兜底答案提示 (流式接口)
+    plan_fallback_notice: str = "[模型未能在时限内回答，以下为预案原文答案]\n\n"
 
 
 # 默认配置实例
@@ -118,3 +152,4 @@ model_config = ModelConfig()
 training_config = TrainingConfig()
 ollama_config = OllamaConfig()
 api_config = APIConfig()
+sla_config = SLAConfig()
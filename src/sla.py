@@ -0,0 +1,154 @@
+"""
+Deadline / SLA helpers for the chat endpoints.
+
+- ThroughputTracker: observed generation speed, used to size ``num_predict``
+- SLAStats: per-endpoint deadline hit / truncation / fallback counters
+- PlanIndex: pre-indexed plan answers substituted when nothing arrives in time
+- DeadlineStream: reads an async Ollama stream and aborts it once the
+  deadline passes
+"""
+
+import asyncio
+import json
+import logging
+import threading
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+
+class ThroughputTracker:
+    """Exponentially weighted tokens/s estimate from Ollama eval stats"""
+
+    def __init__(self, initial_tps: float, alpha: float):
+        self.tokens_per_second = initial_tps
+        self.alpha = alpha
+        self._lock = threading.Lock()
+
+    def observe(self, chunk: Dict[str, Any]) -> None:
+        """Update from a final Ollama chunk carrying eval_count/eval_duration (ns)"""
+        count = chunk.get("eval_count")
+        duration = chunk.get("eval_duration")
+        if not count or not duration:
+            return
+        tps = count / (duration / 1e9)
+        with self._lock:
+            self.tokens_per_second = (1 - self.alpha) * self.tokens_per_second + self.alpha * tps
+
+    def num_predict(self, budget_s: float, minimum: int) -> int:
+        """Number of tokens that fit into the remaining time budget"""
+        return max(minimum, int(self.tokens_per_second * budget_s))
+
+
+class SLAStats:
+    """Per-endpoint SLA counters"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    def record(self, endpoint: str, hit: bool, truncated: bool = False, fallback: bool = False) -> None:
+        with self._lock:
+            s = self._stats.setdefault(
+                endpoint, {"requests": 0, "hits": 0, "truncated": 0, "fallback": 0}
+            )
+            s["requests"] += 1
+            s["hits"] += int(hit)
+            s["truncated"] += int(truncated)
+            s["fallback"] += int(fallback)
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {
+                endpoint: {**s, "hit_rate": s["hits"] / s["requests"] if s["requests"] else 0.0}
+                for endpoint, s in self._stats.items()
+            }
+
+
+def _bigrams(text: str) -> Set[str]:
+    text = "".join(text.split())
+    return {text[i:i + 2] for i in range(len(text) - 1)} or {text}
+
+
+class PlanIndex:
+    """Character-bigram index over the plan Q&A pairs in train_data.json"""
+
+    def __init__(self, path: str, min_similarity: float = 0.0):
+        self.path = path
+        self.min_similarity = min_similarity
+        self._entries: Optional[List[tuple]] = None
+        self._lock = threading.Lock()
+
+    def load(self) -> None:
+        with self._lock:
+            if self._entries is not None:
+                return
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Plan index unavailable ({self.path}): {e}")
+                data = []
+            self._entries = [
+                (_bigrams(item["instruction"] + item.get("input", "")), item["output"])
+                for item in data
+                if item.get("instruction") and item.get("output")
+            ]
+
+    def lookup(self, query: str) -> Optional[str]:
+        """Best-matching plan answer for ``query``, or None below ``min_similarity``"""
+        self.load()
+        grams = _bigrams(query)
+        best, best_score = None, 0.0
+        for keys, answer in self._entries:
+            overlap = len(grams & keys)
+            if not overlap:
+                continue
+            score = overlap / len(grams | keys)
+            if score >= self.min_similarity and score > best_score:
+                best, best_score = answer, score
+        return best
+
+
+class DeadlineStream:
+    """
+    Async iterator over an async Ollama stream, bounded by a deadline.
+
+    Each read is awaited with the remaining time as timeout. When the deadline
+    passes the pending read is cancelled, which aborts the HTTP request to
+    Ollama even if it is stalled before the next token (cold model load, slow
+    prompt eval) and so stops generation. ``truncated`` is then set, as it is
+    when Ollama itself stops at ``num_predict`` (``done_reason == "length"``).
+    """
+
+    def __init__(self, stream: AsyncIterator[Dict[str, Any]], deadline: Optional[float]):
+        self.stream = stream
+        self.deadline = deadline
+        self.truncated = False
+
+    async def _next(self) -> Dict[str, Any]:
+        if self.deadline is None:
+            return await self.stream.__anext__()
+        remaining = self.deadline - time.monotonic()
+        if remaining <= 0:
+            raise asyncio.TimeoutError
+        return await asyncio.wait_for(self.stream.__anext__(), remaining)
+
+    async def __aiter__(self) -> AsyncIterator[Dict[str, Any]]:
+        try:
+            while True:
+                try:
+                    chunk = await self._next()
+                except StopAsyncIteration:
+                    return
+                except asyncio.TimeoutError:
+                    self.truncated = True
+                    return
+                if chunk.get("done") and chunk.get("done_reason") == "length":
+                    self.truncated = True
+                yield chunk
+        finally:
+            aclose = getattr(self.stream, "aclose", None)
+            if aclose is not None:
+                await aclose()
@@ -0,0 +1,266 @@
+"""
+In-memory static asset serving and response compression.
+
+- AssetCache: loads the SPA bundle once, precompresses it (gzip, brotli when
+  installed) and serves it from memory with strong ETags and 304 handling
+- CompressionMiddleware: negotiated compression for JSON API responses above
+  a size threshold
+"""
+
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:  # optional: fall back to gzip only
+    brotli = None
+
+# Hex segment right before the extension, e.g. app.3f9a2c1b.js
+HASH_SEGMENT = re.compile(r"[.-]([0-9a-fA-F]{8,64})\.[A-Za-z0-9]+$")
+
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE = "no-cache"
+
+COMPRESSIBLE_TYPES = {
+    "application/javascript",
+    "application/json",
+    "image/svg+xml",
+}
+
+
+def is_compressible(media_type: str) -> bool:
+    media_type = media_type.split(";")[0].strip()
+    return media_type.startswith("text/") or media_type in COMPRESSIBLE_TYPES
+
+
+def is_content_hashed(name: str, body: bytes) -> bool:
+    """True if the name carries a prefix of the file's own sha256 or md5 digest"""
+    match = HASH_SEGMENT.search(name)
+    if match is None:
+        return False
+    segment = match.group(1).lower()
+    return any(
+        digest.startswith(segment)
+        for digest in (hashlib.sha256(body).hexdigest(), hashlib.md5(body).hexdigest())
+    )
+
+
+def supported_encodings() -> List[str]:
+    """Content codings this server can produce, most preferred first"""
+    return ["br", "gzip"] if brotli is not None else ["gzip"]
+
+
+def negotiate_encoding(accept_encoding: str, available: List[str]) -> Optional[str]:
+    """Pick the first of ``available`` the client accepts (q > 0), else None"""
+    accepted = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[coding.strip().lower()] = q
+    for coding in available:
+        if accepted.get(coding, accepted.get("*", 0.0)) > 0:
+            return coding
+    return None
+
+
+def compress(body: bytes, encoding: str, static: bool = False) -> bytes:
+    """Compress with maximum effort for one-off static assets, moderate otherwise"""
+    if encoding == "br":
+        return brotli.compress(body, quality=11 if static else 5)
+    return gzip.compress(body, compresslevel=9 if static else 6, mtime=0)
+
+
+@dataclass
+class Asset:
+    media_type: str
+    etag: str
+    cache_control: str
+    mtime: float
+    bodies: Dict[str, bytes] = field(default_factory=dict)  # "identity" / "gzip" / "br"
+
+
+class AssetCache:
+    """
+    Static files held in memory. With ``reload`` enabled (dev) the directory
+    is rescanned at most once per ``reload_interval`` seconds and changed
+    files are reloaded. Files named after their own content digest (or, if
+    given, matching ``immutable_pattern``) get immutable cache headers;
+    everything else is revalidated.
+    """
+
+    def __init__(self, directory: str, min_size: int = 1024, reload: bool = False, reload_interval: float = 1.0,
+                 immutable_pattern: Optional[str] = None):
+        self.directory = directory
+        self.immutable_pattern = re.compile(immutable_pattern) if immutable_pattern else None
+        self.min_size = min_size
+        self.reload = reload
+        self.reload_interval = reload_interval
+        self._assets: Dict[str, Asset] = {}
+        self._last_scan = 0.0
+        self._lock = threading.Lock()
+
+    def _load_file(self, full_path: str, mtime: float) -> Asset:
+        with open(full_path, "rb") as f:
+            body = f.read()
+        media_type = mimetypes.guess_type(full_path)[0] or "application/octet-stream"
+        name = os.path.basename(full_path)
+        if self.immutable_pattern is not None:
+            immutable = bool(self.immutable_pattern.search(name))
+        else:
+            immutable = is_content_hashed(name, body)
+        asset = Asset(
+            media_type=media_type,
+            etag='"%s"' % hashlib.sha256(body).hexdigest()[:32],
+            cache_control=IMMUTABLE_CACHE if immutable else REVALIDATE_CACHE,
+            mtime=mtime,
+            bodies={"identity": body},
+        )
+        if len(body) >= self.min_size and is_compressible(media_type):
+            for encoding in supported_encodings():
+                compressed = compress(body, encoding, static=True)
+                if len(compressed) < len(body):
+                    asset.bodies[encoding] = compressed
+        return asset
+
+    def scan(self) -> None:
+        """(Re)load every file under the directory whose mtime changed"""
+        assets = {}
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                full_path = os.path.join(root, name)
+                rel_path = os.path.relpath(full_path, self.directory).replace(os.sep, "/")
+                mtime = os.stat(full_path).st_mtime
+                current = self._assets.get(rel_path)
+                assets[rel_path] = current if current and current.mtime == mtime else self._load_file(full_path, mtime)
+        self._assets = assets
+        self._last_scan = time.monotonic()
+
+    def get(self, path: str) -> Optional[Asset]:
+        if self.reload and time.monotonic() - self._last_scan >= self.reload_interval:
+            with self._lock:
+                self.scan()
+        return self._assets.get(path)
+
+    def response(self, path: str, request: Request) -> Optional[Response]:
+        """Response for ``path``, or None if no such asset"""
+        asset = self.get(path)
+        if asset is None:
+            return None
+
+        encodings = [e for e in supported_encodings() if e in asset.bodies]
+        encoding = negotiate_encoding(request.headers.get("accept-encoding", ""), encodings)
+        etag = asset.etag if encoding is None else '%s-%s"' % (asset.etag[:-1], encoding)
+        headers = {"ETag": etag, "Cache-Control": asset.cache_control}
+        if encodings:
+            headers["Vary"] = "Accept-Encoding"
+
+        if self._not_modified(request.headers.get("if-none-match"), asset.etag):
+            return Response(status_code=304, headers=headers)
+
+        if encoding is not None:
+            headers["Content-Encoding"] = encoding
+        body = asset.bodies[encoding or "identity"]
+        if request.method == "HEAD":
+            headers["Content-Length"] = str(len(body))
+            body = b""
+        return Response(content=body, media_type=asset.media_type, headers=headers)
+
+    @staticmethod
+    def _not_modified(if_none_match: Optional[str], etag: str) -> bool:
+        """Any representation of the same content satisfies If-None-Match"""
+        if not if_none_match:
+            return False
+        base = etag.strip('"')
+        for tag in if_none_match.split(","):
+            tag = tag.strip()
+            if tag == "*":
+                return True
+            tag = tag[2:] if tag.startswith("W/") else tag
+            tag = tag.strip('"')
+            if tag == base or tag.startswith(base + "-"):
+                return True
+        return False
+
+
+class CompressionMiddleware:
+    """
+    Compress JSON responses above ``min_size`` using the client's preferred
+    coding. Streaming and already-encoded responses pass through untouched.
+    """
+
+    def __init__(self, app: ASGIApp, min_size: int = 1024):
+        self.app = app
+        self.min_size = min_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_headers = dict(scope["headers"])
+        encoding = negotiate_encoding(
+            request_headers.get(b"accept-encoding", b"").decode("latin-1"), supported_encodings()
+        )
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start: Optional[Message] = None
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal start
+            if message["type"] == "http.response.start":
+                headers = {k.lower(): v for k, v in message.get("headers", [])}
+                if (
+                    headers.get(b"content-type", b"").startswith(b"application/json")
+                    and b"content-encoding" not in headers
+                ):
+                    # JSON candidate: hold start until the body size is known
+                    start = message
+                else:
+                    await send(message)
+                return
+            if message["type"] != "http.response.body" or start is None:
+                await send(message)
+                return
+
+            held, start = start, None
+            body = message.get("body", b"")
+            if message.get("more_body", False) or len(body) < self.min_size:
+                await send(held)
+                await send(message)
+                return
+
+            compressed = compress(body, encoding)
+            vary = {k.lower(): v for k, v in held.get("headers", [])}.get(b"vary")
+            raw_headers = [
+                (k, v) for k, v in held.get("headers", []) if k.lower() not in (b"content-length", b"vary")
+            ]
+            raw_headers += [
+                (b"content-encoding", encoding.encode("latin-1")),
+                (b"content-length", str(len(compressed)).encode("latin-1")),
+                (b"vary", vary + b", Accept-Encoding" if vary else b"Accept-Encoding"),
+            ]
+            await send({**held, "headers": raw_headers})
+            await send({"type": "http.response.body", "body": compressed})
+
+        await self.app(scope, receive, send_wrapper)
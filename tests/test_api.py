@@ -1,3 +1,6 @@
+import asyncio
+import hashlib
+import time
 import pytest
 from fastapi.testclient import TestClient
 from unittest.mock import patch, MagicMock
@@ -8,7 +11,11 @@ from pathlib import Path
 project_root = str(Path(__file__).parent.parent)
 sys.path.append(project_root)
 
-from src.api import app
+from src.api import app, plan_index, throughput
+from src.config import sla_config
+from src.static import (
+    IMMUTABLE_CACHE, REVALIDATE_CACHE, AssetCache, CompressionMiddleware, is_content_hashed
+)
 
 client = TestClient(app)
 
@@ -46,3 +53,248 @@ def test_chat_error_handling(mock_chat):
     
     assert response.status_code == 500
     assert "Ollama connection failed" in response.json()['detail']
+
+class FakeAsyncClient:
+    """Stands in for ollama.AsyncClient, streaming chunks with a delay"""
+    def __init__(self, *chunks, delay=0.0, eval_count=100, eval_duration=2_000_000_000, done_reason='stop'):
+        self.chunks = chunks
+        self.done_reason = done_reason
+        self.delay = delay
+        self.eval_count = eval_count
+        self.eval_duration = eval_duration
+        self.options = None
+        self.cancelled = False
+    
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, *exc):
+        return False
+    
+    async def chat(self, **kwargs):
+        self.options = kwargs['options']
+        return self._stream()
+    
+    async def _stream(self):
+        try:
+            for content in self.chunks:
+                await asyncio.sleep(self.delay)
+                yield {'message': {'content': content}, 'done': False}
+            yield {'message': {'content': ''}, 'done': True, 'done_reason': self.done_reason,
+                   'eval_count': self.eval_count, 'eval_duration': self.eval_duration}
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+
+@pytest.fixture
+def initial_throughput(monkeypatch):
+    monkeypatch.setattr(throughput, 'tokens_per_second', sla_config.initial_tokens_per_second)
+
+def test_chat_deadline_sets_num_predict(initial_throughput):
+    fake = FakeAsyncClient('按预案', '处置')
+    with patch('ollama.AsyncClient', return_value=fake):
+        response = client.post("/api/v1/chat", json={"message": "火灾", "deadline_ms": 3000})
+    
+    assert response.status_code == 200
+    data = response.json()
+    assert data['response'] == '按预案处置'
+    assert data['truncated'] is False
+    assert data['source'] == 'model'
+    # 3000 ms * (1 - 0.2) * 20 tok/s
+    assert fake.options['num_predict'] == 48
+
+def test_observed_throughput_sizes_next_num_predict(initial_throughput):
+    # 100 tokens in 2 s -> 50 tok/s
+    with patch('ollama.AsyncClient', return_value=FakeAsyncClient('处置')):
+        client.post("/api/v1/chat", json={"message": "火灾", "deadline_ms": 3000})
+    
+    fake = FakeAsyncClient('处置')
+    with patch('ollama.AsyncClient', return_value=fake):
+        client.post("/api/v1/chat", json={"message": "火灾", "deadline_ms": 3000})
+    
+    # EWMA 0.7 * 20 + 0.3 * 50 = 29 tok/s over 2.4 s
+    assert fake.options['num_predict'] == 69
+
+def test_chat_deadline_truncates():
+    fake = FakeAsyncClient('第一步', '第二步', '第三步', delay=0.5)
+    with patch('ollama.AsyncClient', return_value=fake):
+        response = client.post("/api/v1/chat", json={"message": "火灾", "deadline_ms": 700})
+    
+    assert response.status_code == 200
+    data = response.json()
+    assert data['truncated'] is True
+    assert data['source'] == 'model'
+    assert data['response'] == '第一步'
+    assert fake.cancelled
+
+def test_chat_deadline_falls_back_to_plan():
+    # Model stalls before the first token: the request must be aborted at the deadline
+    fake = FakeAsyncClient('太慢了', delay=10.0)
+    before = client.get("/api/v1/sla").json().get('chat', {}).get('fallback', 0)
+    
+    payload = {"message": "地铁运营企业确认发生列车脱轨事故后，最晚应该在几分钟内上报？", "priority": "urgent", "deadline_ms": 200}
+    started = time.monotonic()
+    with patch('ollama.AsyncClient', return_value=fake):
+        response = client.post("/api/v1/chat", json=payload)
+    
+    assert time.monotonic() - started < 2.0
+    assert fake.cancelled
+    assert response.status_code == 200
+    data = response.json()
+    assert data['source'] == 'plan'
+    assert '5分钟内' in data['response']
+    stats = client.get("/api/v1/sla").json()['chat']
+    assert stats['fallback'] == before + 1
+    assert 0.0 <= stats['hit_rate'] <= 1.0
+
+def test_chat_stream_deadline_truncates():
+    fake = FakeAsyncClient('第一步', '第二步', '第三步', delay=0.5)
+    before = client.get("/api/v1/sla").json().get('chat_stream', {}).get('truncated', 0)
+    
+    with patch('ollama.AsyncClient', return_value=fake):
+        response = client.post("/api/v1/chat/stream", json={"message": "火灾", "deadline_ms": 700})
+    
+    assert response.status_code == 200
+    assert response.headers['x-deadline-ms'] == '700'
+    assert response.text == '第一步' + sla_config.truncation_notice
+    assert fake.cancelled
+    stats = client.get("/api/v1/sla").json()['chat_stream']
+    assert stats['truncated'] == before + 1
+
+def test_chat_stream_deadline_falls_back_to_plan():
+    fake = FakeAsyncClient('太慢了', delay=10.0)
+    before = client.get("/api/v1/sla").json().get('chat_stream', {}).get('fallback', 0)
+    
+    payload = {"message": "地铁运营企业确认发生列车脱轨事故后，最晚应该在几分钟内上报？", "deadline_ms": 200}
+    with patch('ollama.AsyncClient', return_value=fake):
+        response = client.post("/api/v1/chat/stream", json=payload)
+    
+    assert response.status_code == 200
+    assert response.text.startswith(sla_config.plan_fallback_notice)
+    assert '5分钟内' in response.text
+    assert sla_config.truncation_notice not in response.text
+    stats = client.get("/api/v1/sla").json()['chat_stream']
+    assert stats['fallback'] == before + 1
+
+def test_chat_length_cap_marks_truncated():
+    before = client.get("/api/v1/sla").json().get('chat', {'hits': 0, 'truncated': 0})
+    
+    fake = FakeAsyncClient('第一步', done_reason='length')
+    with patch('ollama.AsyncClient', return_value=fake):
+        response = client.post("/api/v1/chat", json={"message": "火灾", "deadline_ms": 3000})
+    
+    data = response.json()
+    assert data['response'] == '第一步'
+    assert data['truncated'] is True
+    assert data['source'] == 'model'
+    stats = client.get("/api/v1/sla").json()['chat']
+    assert stats['hits'] == before['hits']
+    assert stats['truncated'] == before['truncated'] + 1
+
+def test_chat_stream_length_cap_appends_notice():
+    fake = FakeAsyncClient('第一步', done_reason='length')
+    with patch('ollama.AsyncClient', return_value=fake):
+        response = client.post("/api/v1/chat/stream", json={"message": "火灾", "deadline_ms": 3000})
+    
+    assert response.text == '第一步' + sla_config.truncation_notice
+
+def test_plan_lookup_rejects_unrelated_query():
+    assert plan_index.lookup("今天天气怎么样") is None
+    assert plan_index.lookup("zzqq") is None
+
+def test_chat_deadline_without_plan_match_is_504():
+    before = client.get("/api/v1/sla").json().get('chat', {'requests': 0, 'hits': 0, 'fallback': 0})
+    
+    fake = FakeAsyncClient('太慢了', delay=10.0)
+    with patch('ollama.AsyncClient', return_value=fake):
+        response = client.post("/api/v1/chat", json={"message": "zzqq", "deadline_ms": 200})
+    
+    assert response.status_code == 504
+    stats = client.get("/api/v1/sla").json()['chat']
+    assert stats['requests'] == before['requests'] + 1
+    assert stats['hits'] == before['hits']
+    assert stats['fallback'] == before['fallback']
+
+def test_static_asset_etag_and_304():
+    response = client.get("/static/app.js", headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers['content-encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.headers['vary']
+    assert response.headers['cache-control'] == 'no-cache'
+    etag = response.headers['etag']
+    
+    response = client.get("/static/app.js", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b''
+
+def test_spa_fallback_serves_index():
+    response = client.get("/some/client/route")
+    assert response.status_code == 200
+    assert response.headers['content-type'].startswith('text/html')
+    assert '应急处置助手' in response.text
+    
+    assert client.get("/static/missing.js").status_code == 404
+
+@patch('ollama.chat')
+def test_chat_json_compression(mock_chat):
+    mock_chat.return_value = {'message': {'content': '疏散乘客。' * 500}}
+    
+    response = client.post("/api/v1/chat", json={"message": "火灾"}, headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers['content-encoding'] == 'gzip'
+    assert response.json()['response'].startswith('疏散乘客')
+    
+    response = client.get("/api/v1/health", headers={"Accept-Encoding": "gzip"})
+    assert 'content-encoding' not in response.headers
+
+def test_compression_does_not_hold_stream_start():
+    sent = []
+    
+    async def streaming_app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200,
+                    "headers": [(b"content-type", b"text/plain; charset=utf-8")]})
+        # Headers must reach the client before the first token
+        assert [m["type"] for m in sent] == ["http.response.start"]
+        await send({"type": "http.response.body", "body": b"x", "more_body": False})
+    
+    async def send(message):
+        sent.append(message)
+    
+    middleware = CompressionMiddleware(streaming_app, min_size=1)
+    scope = {"type": "http", "headers": [(b"accept-encoding", b"gzip")]}
+    asyncio.run(middleware(scope, None, send))
+    assert [m["type"] for m in sent] == ["http.response.start", "http.response.body"]
+
+def test_hashed_asset_names():
+    body = b"console.log('metro');"
+    digest = hashlib.sha256(body).hexdigest()
+    assert is_content_hashed(f"app.{digest[:8]}.js", body)
+    assert is_content_hashed(f"index-{digest[:16]}.js", body)
+    assert is_content_hashed(f"app.{hashlib.md5(body).hexdigest()[:20]}.js", body)
+    for name in ["app.3f9a2c1b.js", "report.20241120.json", "app.js", "jquery.min.js",
+                 "bg-1920x1080.jpg", "icons-v20240101.svg", "roboto-latin400.woff2",
+                 "chunk-vendors2024.js", "index-BxY3k9aZ.js"]:
+        assert not is_content_hashed(name, body), name
+
+def test_spa_without_index_returns_404():
+    with patch('src.api.assets.response', return_value=None):
+        assert client.get("/").status_code == 404
+        response = client.get("/some/client/route")
+        assert response.status_code == 404
+        assert response.json() == {"detail": "Not Found"}
+
+def test_immutable_cache_headers(tmp_path):
+    body = b"body { color: red; }"
+    hashed = f"style.{hashlib.sha256(body).hexdigest()[:8]}.css"
+    (tmp_path / hashed).write_bytes(body)
+    (tmp_path / "chunk-vendors2024.js").write_bytes(body)
+    
+    cache = AssetCache(str(tmp_path))
+    cache.scan()
+    assert cache.get(hashed).cache_control == IMMUTABLE_CACHE
+    assert cache.get("chunk-vendors2024.js").cache_control == REVALIDATE_CACHE
+    
+    cache = AssetCache(str(tmp_path), immutable_pattern=r"-vendors\d+\.js$")
+    cache.scan()
+    assert cache.get("chunk-vendors2024.js").cache_control == IMMUTABLE_CACHE
+    assert cache.get(hashed).cache_control == REVALIDATE_CACHE